@@ -0,0 +1,57 @@
+# ==========================
+# File: _geo_kernels.py
+# Shared haversine kernels (Numba-JIT when available)
+# ==========================
+from __future__ import annotations
+import math
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+_EARTH_RADIUS_KM = 6371.0
+
+
+def _haversine_km_py(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return _EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+if NUMBA_AVAILABLE:
+    # cache=True persists the compiled kernel across runs so only the very
+    # first invocation ever pays the compile cost.
+    haversine_km = njit(cache=True, fastmath=True)(_haversine_km_py)
+
+    @njit(cache=True, fastmath=True, parallel=True)
+    def haversine_batch(lat0, lon0, lats, lons, out):
+        for i in prange(lats.size):
+            out[i] = haversine_km(lat0, lon0, lats[i], lons[i])
+        return out
+else:
+    haversine_km = _haversine_km_py
+
+    def haversine_batch(lat0, lon0, lats, lons, out):
+        lat0_r = math.radians(lat0)
+        lon0_r = math.radians(lon0)
+        lats_r = np.radians(lats)
+        lons_r = np.radians(lons)
+        a = (
+            np.sin((lats_r - lat0_r) / 2) ** 2
+            + np.cos(lat0_r) * np.cos(lats_r) * np.sin((lons_r - lon0_r) / 2) ** 2
+        )
+        out[:] = _EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(a))
+        return out
+
+
+def warmup() -> None:
+    """Trigger JIT compilation ahead of the first real query."""
+    haversine_km(0.0, 0.0, 1.0, 1.0)
+    haversine_batch(0.0, 0.0, np.zeros(1), np.zeros(1), np.empty(1))
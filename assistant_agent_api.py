@@ -3,14 +3,59 @@
 # ==========================
 
 from __future__ import annotations
+import asyncio
+import json
 import os
+import re
+import types
 from typing import Any, Dict, List
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 from dummy_map_server import DummyMapServer
 from openstreetmap_server import OpenStreetMapServer
 
 
+# ==========================
+# HARD RULES (compiled once)
+# ==========================
+# Deterministic phrasings skip the LLM round-trip entirely; handlers
+# return the same shape as message.function_call so execute() is unchanged.
+
+_RE_WHERE = re.compile(r"where is (.+)")
+_RE_WHAT_AT = re.compile(r"what is at ([0-9.\-]+)[ ,]+([0-9.\-]+)")
+_RE_FIND_NEAR = re.compile(r"find (.+) near (.+)")
+_RE_ROUTE = re.compile(r"give me a route from (.+) to (.+)")
+
+
+def _call(name: str, **args) -> types.SimpleNamespace:
+    return types.SimpleNamespace(name=name, arguments=json.dumps(args))
+
+
+def _rule_where(m):
+    place = m.group(1).replace("located", "").strip()
+    return _call("osm_geocode", query=place)
+
+
+def _rule_what_at(m):
+    return _call("osm_reverse_geocode", lat=float(m.group(1)), lon=float(m.group(2)))
+
+
+def _rule_find_near(m):
+    return _call("dummy_poi", query=m.group(1).strip(), near=m.group(2).strip())
+
+
+def _rule_route(m):
+    return _call("osm_route", origin=m.group(1).strip(), destination=m.group(2).strip())
+
+
+_RULES = [
+    (_RE_WHERE, _rule_where),
+    (_RE_WHAT_AT, _rule_what_at),
+    (_RE_FIND_NEAR, _rule_find_near),
+    (_RE_ROUTE, _rule_route),
+]
+
+
 # ==========================
 # MAP TOOL WRAPPERS
 # ==========================
@@ -46,6 +91,96 @@ class OpenStreetMapTool:
         return self.server.matrix(places)
 
 
+# ==========================
+# FUNCTION SCHEMA (shared, immutable)
+# ==========================
+# Built once at import; every agent instance points at the same list
+# instead of reconstructing ~150 lines of dicts per __init__.
+
+_FUNCTIONS = [
+    {
+        "name": "dummy_geocode",
+        "description": "Local dummy geocoding.",
+        "parameters": {
+            "type": "object",
+            "properties": {"query": {"type": "string"}},
+            "required": ["query"],
+        },
+    },
+    {
+        "name": "dummy_route",
+        "description": "Local dummy routing.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "origin": {"type": "string"},
+                "destination": {"type": "string"},
+            },
+            "required": ["origin", "destination"],
+        },
+    },
+    {
+        "name": "dummy_poi",
+        "description": "Local POI search.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string"},
+                "near": {"type": "string"},
+            },
+            "required": ["query", "near"],
+        },
+    },
+    {
+        "name": "osm_geocode",
+        "description": "Real OpenStreetMap geocoding.",
+        "parameters": {
+            "type": "object",
+            "properties": {"query": {"type": "string"}},
+            "required": ["query"],
+        },
+    },
+    {
+        "name": "osm_reverse_geocode",
+        "description": "Reverse geocode lat/lon.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "lat": {"type": "number"},
+                "lon": {"type": "number"},
+            },
+            "required": ["lat", "lon"],
+        },
+    },
+    {
+        "name": "osm_route",
+        "description": "OSM routing.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "origin": {"type": "string"},
+                "destination": {"type": "string"},
+            },
+            "required": ["origin", "destination"],
+        },
+    },
+    {
+        "name": "osm_matrix",
+        "description": "Matrix distances/times.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "places": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                }
+            },
+            "required": ["places"],
+        },
+    },
+]
+
+
 # ==========================
 # ASSISTANT AGENT (FUNCTION CALLING)
 # ==========================
@@ -54,7 +189,7 @@ class AssistantAgent:
     def __init__(self, api_key: str | None = None, model: str = "gpt-4o-mini"):
 
         api_key = api_key or os.getenv("OPENAI_API_KEY")
-        self.client = OpenAI(api_key=api_key)
+        self.client = AsyncOpenAI(api_key=api_key)
         self.model = model
 
         self.dummy = DummyMapTool()
@@ -62,98 +197,38 @@ class AssistantAgent:
 
         self.last_call: Dict[str, Any] | None = None
 
-        # **The function definitions**
-        self.functions = [
-            {
-                "name": "dummy_geocode",
-                "description": "Local dummy geocoding.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {"query": {"type": "string"}},
-                    "required": ["query"],
-                },
-            },
-            {
-                "name": "dummy_route",
-                "description": "Local dummy routing.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "origin": {"type": "string"},
-                        "destination": {"type": "string"},
-                    },
-                    "required": ["origin", "destination"],
-                },
-            },
-            {
-                "name": "dummy_poi",
-                "description": "Local POI search.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "query": {"type": "string"},
-                        "near": {"type": "string"},
-                    },
-                    "required": ["query", "near"],
-                },
-            },
-            {
-                "name": "osm_geocode",
-                "description": "Real OpenStreetMap geocoding.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {"query": {"type": "string"}},
-                    "required": ["query"],
-                },
-            },
-            {
-                "name": "osm_reverse_geocode",
-                "description": "Reverse geocode lat/lon.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "lat": {"type": "number"},
-                        "lon": {"type": "number"},
-                    },
-                    "required": ["lat", "lon"],
-                },
-            },
-            {
-                "name": "osm_route",
-                "description": "OSM routing.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "origin": {"type": "string"},
-                        "destination": {"type": "string"},
-                    },
-                    "required": ["origin", "destination"],
-                },
-            },
-            {
-                "name": "osm_matrix",
-                "description": "Matrix distances/times.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "places": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                        }
-                    },
-                    "required": ["places"],
-                },
-            },
-        ]
+        # O(1) function-name dispatch instead of an if/elif chain;
+        # adding a tool is a one-line entry here.
+        self._dispatch = {
+            "dummy_geocode": lambda a: self.dummy.geocode(a["query"]),
+            "dummy_route": lambda a: self.dummy.route(a["origin"], a["destination"]),
+            "dummy_poi": lambda a: self.dummy.poi(a["query"], a["near"]),
+            "osm_geocode": lambda a: self.osm.geocode(a["query"]),
+            "osm_reverse_geocode": lambda a: self.osm.reverse_geocode(a["lat"], a["lon"]),
+            "osm_route": lambda a: self.osm.route(a["origin"], a["destination"]),
+            "osm_matrix": lambda a: self.osm.matrix(a["places"]),
+        }
+
+        # **The function definitions** (module-level, shared across instances)
+        self.functions = _FUNCTIONS
 
     # ==========================
     # RUN USER MESSAGE THROUGH LLM
     # ==========================
 
-    def interpret(self, message: str):
+    async def interpret(self, message: str):
         """Send user message → model → get function call"""
 
-        completion = self.client.chat.completions.create(
+        # Hard rules first: the obvious cases cost zero API calls
+        lower = message.strip().lower()
+        for pat, handler in _RULES:
+            m = pat.match(lower)
+            if m:
+                fn = handler(m)
+                self.last_call = fn
+                return fn
+
+        completion = await self.client.chat.completions.create(
             model=self.model,
             messages=[
                 {
@@ -183,57 +258,53 @@ class AssistantAgent:
     # EXECUTE FUNCTION CALL
     # ==========================
 
-    def execute(self, fn) -> Any:
+    async def execute(self, fn) -> Any:
+        # Tool calls are blocking HTTP/local work; run them off the event
+        # loop so concurrent turns can stay in flight.
+        return await asyncio.to_thread(self._execute_sync, fn)
+
+    def _execute_sync(self, fn) -> Any:
         name = fn.name
         args = fn.arguments
+        if isinstance(args, str):
+            # The SDK delivers arguments as a JSON-encoded string
+            args = json.loads(args)
 
-        # Dummy tool
-        if name == "dummy_geocode":
-            return self.dummy.geocode(args["query"])
-
-        if name == "dummy_route":
-            return self.dummy.route(args["origin"], args["destination"])
-
-        if name == "dummy_poi":
-            return self.dummy.poi(args["query"], args["near"])
-
-        # OSM tool
-        if name == "osm_geocode":
-            return self.osm.geocode(args["query"])
-
-        if name == "osm_reverse_geocode":
-            return self.osm.reverse_geocode(args["lat"], args["lon"])
-
-        if name == "osm_route":
-            return self.osm.route(args["origin"], args["destination"])
-
-        if name == "osm_matrix":
-            return self.osm.matrix(args["places"])
-
-        return {"error": f"Unknown function '{name}'"}
+        handler = self._dispatch.get(name)
+        if handler is None:
+            return {"error": f"Unknown function '{name}'"}
+        return handler(args)
 
     # ==========================
     # MAIN LOOP
     # ==========================
 
-    def run(self):
+    async def run(self):
         print("🌍 OpenAI Smart Map Assistant (Function Calling) ready.\n")
 
         while True:
-            msg = input("You: ")
+            msg = await asyncio.to_thread(input, "You: ")
             if msg.lower() in ("quit", "exit"):
                 break
             if msg.lower() in ("again", "repeat") and self.last_call:
                 fn = self.last_call
-                result = self.execute(fn)
+                result = await self.execute(fn)
                 print("🧭 Result:", result)
                 continue
 
-            fn = self.interpret(msg)
-            if "error" in fn:
+            fn = await self.interpret(msg)
+            if isinstance(fn, dict) and "error" in fn:
                 print("⚠️ Error:", fn["error"])
                 continue
 
-            result = self.execute(fn)
+            result = await self.execute(fn)
             print("🧭 Result:", result)
             print()
+
+
+# ==========================
+# MAIN
+# ==========================
+
+if __name__ == "__main__":
+    asyncio.run(AssistantAgent().run())
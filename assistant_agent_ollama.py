@@ -2,13 +2,23 @@
 # File: assistant.py
 # ==========================
 from __future__ import annotations
+import copy
 import json, re
+from collections import OrderedDict
 from typing import Any, Dict
 
 from ollama_client import OllamaClient
 from dummy_map_server import DummyMapServer
 from openstreetmap_server import OpenStreetMapServer
 
+try:
+    import orjson
+
+    def _json_loads(text):
+        return orjson.loads(text)
+except ImportError:  # fall back to the stdlib codec
+    _json_loads = json.loads
+
 
 # ==========================
 # MAP TOOLS
@@ -27,21 +37,23 @@ class DummyMapTool(MapTool):
 
     def __init__(self):
         self.server = DummyMapServer()
+        # O(1) action dispatch instead of an if/elif chain
+        self._actions = {
+            "geocode": lambda kw: self.server.geocode(kw.get("query")),
+            "route": lambda kw: self.server.route(kw.get("origin"), kw.get("destination")),
+            "poi": self._poi,
+        }
+
+    def _poi(self, kw):
+        res = self.server.search_poi(kw.get("query"), kw.get("near"))
+        return res if res else {"message": "No places found matching your search."}
 
     def run(self, action: str, **kwargs):
         try:
-            if action == "geocode":
-                return self.server.geocode(kwargs.get("query"))
-
-            elif action == "route":
-                return self.server.route(kwargs.get("origin"), kwargs.get("destination"))
-
-            elif action == "poi":
-                res = self.server.search_poi(kwargs.get("query"), kwargs.get("near"))
-                return res if res else {"message": "No places found matching your search."}
-
-            else:
+            handler = self._actions.get(action)
+            if handler is None:
                 return {"error": f"Unknown action: {action}"}
+            return handler(kwargs)
 
         except Exception as e:
             return {"error": str(e)}
@@ -53,31 +65,80 @@ class OpenStreetMapTool(MapTool):
 
     def __init__(self):
         self.server = OpenStreetMapServer()
+        self._actions = {
+            "geocode": lambda kw: self.server.geocode(kw.get("query")),
+            "reverse_geocode": lambda kw: self.server.reverse_geocode(float(kw["lat"]),
+                                                                      float(kw["lon"])),
+            "route": lambda kw: self.server.route(kw.get("origin"),
+                                                  kw.get("destination")),
+            "matrix": self._matrix,
+        }
+
+    def _matrix(self, kw):
+        places = kw.get("places")
+        if not places:
+            return {"error": "Matrix requires a list of places."}
+        return self.server.matrix(places)
 
     def run(self, action: str, **kwargs):
         try:
-            if action == "geocode":
-                return self.server.geocode(kwargs.get("query"))
+            handler = self._actions.get(action)
+            if handler is None:
+                return {"error": f"Unsupported action: {action}"}
+            return handler(kwargs)
 
-            elif action == "reverse_geocode":
-                return self.server.reverse_geocode(float(kwargs["lat"]),
-                                                   float(kwargs["lon"]))
+        except Exception as e:
+            return {"error": str(e)}
 
-            elif action == "route":
-                return self.server.route(kwargs.get("origin"),
-                                         kwargs.get("destination"))
 
-            elif action == "matrix":
-                places = kwargs.get("places")
-                if not places:
-                    return {"error": "Matrix requires a list of places."}
-                return self.server.matrix(places)
+# ==========================
+# HARD RULES (compiled once)
+# ==========================
+
+_RE_WHERE = re.compile(r"where is (.+)")
+_RE_WHAT_AT = re.compile(r"what is at ([0-9.\-]+)[ ,]+([0-9.\-]+)")
+_RE_FIND_NEAR = re.compile(r"find (.+) near (.+)")
+_RE_ROUTE = re.compile(r"give me a route from (.+) to (.+)")
+_RE_MATRIX = re.compile(r"matrix (for )?(.*)")
 
-            else:
-                return {"error": f"Unsupported action: {action}"}
 
-        except Exception as e:
-            return {"error": str(e)}
+def _handle_where(m):
+    place = m.group(1).replace("located", "").strip()
+    print(f"DEBUG — place extracted: {place}")
+    return {"tool": "osm", "action": "geocode", "params": {"query": place}}
+
+
+def _handle_what_at(m):
+    return {
+        "tool": "osm",
+        "action": "reverse_geocode",
+        "params": {"lat": m.group(1), "lon": m.group(2)}
+    }
+
+
+def _handle_find_near(m):
+    return {
+        "tool": "dummy",
+        "action": "poi",
+        "params": {"query": m.group(1).strip(), "near": m.group(2).strip()}
+    }
+
+
+def _handle_route(m):
+    return {
+        "tool": "osm",
+        "action": "route",
+        "params": {"origin": m.group(1).strip(), "destination": m.group(2).strip()}
+    }
+
+
+# Pattern → handler pairs tried in order on every message
+_RULES = [
+    (_RE_WHERE, _handle_where),
+    (_RE_WHAT_AT, _handle_what_at),
+    (_RE_FIND_NEAR, _handle_find_near),
+    (_RE_ROUTE, _handle_route),
+]
 
 
 # ==========================
@@ -93,21 +154,69 @@ class AssistantAgent:
         }
         self.last_plan: Dict[str, Any] | None = None
 
+        # LRU cache of interpreted plans keyed on the normalized message,
+        # so repeated prompts skip the regex scan and (worse) the LLM call.
+        self._plan_cache: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._plan_cache_max = 256
+        self.plan_cache_stats = {"hits": 0, "misses": 0}
+
+
+    # ---------- PLAN CACHE ----------
+    @staticmethod
+    def _plan_key(raw: str) -> str:
+        # Lowercase, collapse whitespace, drop trailing punctuation
+        return " ".join(raw.lower().split()).rstrip("?!. ")
+
+    def _cache_plan(self, key: str, plan: Dict[str, Any]) -> Dict[str, Any]:
+        self._plan_cache[key] = plan
+        if len(self._plan_cache) > self._plan_cache_max:
+            self._plan_cache.popitem(last=False)
+        # Every successfully interpreted plan becomes "the last plan" for
+        # again/repeat/same — rule hits, LLM plans and cache hits alike.
+        self.last_plan = plan
+        # Deep copy so callers can't mutate the cached plan through
+        # its nested params dict
+        return copy.deepcopy(plan)
+
 
     # ---------- JSON Extraction ----------
     def _extract_json(self, text: str):
+        text = text.strip()
         try:
-            return json.loads(text)
-        except:
+            return _json_loads(text)
+        except Exception:
             pass
 
-        blocks = re.findall(r"\{[\s\S]*?\}", text)
-        for b in blocks:
-            try:
-                return json.loads(b)
-            except:
-                continue
-
+        # One-pass balanced-brace scan for the outermost JSON object.
+        # The old non-greedy regex only ever matched innermost pairs, so
+        # any nested plan failed to parse.
+        start = text.find("{")
+        if start < 0:
+            return None
+        depth = 0
+        in_str = False
+        esc = False
+        for i in range(start, len(text)):
+            c = text[i]
+            if in_str:
+                if esc:
+                    esc = False
+                elif c == "\\":
+                    esc = True
+                elif c == '"':
+                    in_str = False
+            else:
+                if c == '"':
+                    in_str = True
+                elif c == "{":
+                    depth += 1
+                elif c == "}":
+                    depth -= 1
+                    if depth == 0:
+                        try:
+                            return _json_loads(text[start:i + 1])
+                        except Exception:
+                            return None
         return None
 
 
@@ -115,59 +224,48 @@ class AssistantAgent:
     def interpret(self, message: str) -> Dict[str, Any]:
 
         raw = message.strip()
-        lower = raw.lower()
+
+        # ==============================
+        #       PLAN CACHE
+        # ==============================
+
+        # The canonical form is both the cache key and the text the rules
+        # match against, so the cached plan always agrees with its key:
+        # "Where is Paris?" extracts "paris", not "paris?".
+        key = self._plan_key(raw)
+        if key not in {"again", "repeat", "same"}:  # those depend on state
+            cached = self._plan_cache.get(key)
+            if cached is not None:
+                self._plan_cache.move_to_end(key)
+                self.plan_cache_stats["hits"] += 1
+                # A hit is still "the last plan" for again/repeat/same,
+                # mirroring the LLM path below
+                self.last_plan = cached
+                return copy.deepcopy(cached)
+            self.plan_cache_stats["misses"] += 1
 
         # ==============================
         #       HARD RULES
         # ==============================
 
-        # WHERE IS <PLACE>
-        m = re.match(r"where is (.+)", lower)
-        if m:
-            place = m.group(1).replace("located", "").strip()
-            print(f"DEBUG — place extracted: {place}")
-            return {"tool": "osm", "action": "geocode", "params": {"query": place}}
-
-        # WHAT IS AT <LAT>, <LON>
-        m = re.match(r"what is at ([0-9.\-]+)[ ,]+([0-9.\-]+)", lower)
-        if m:
-            return {
-                "tool": "osm",
-                "action": "reverse_geocode",
-                "params": {"lat": m.group(1), "lon": m.group(2)}
-            }
-
-        # FIND X NEAR Y
-        m = re.match(r"find (.+) near (.+)", lower)
-        if m:
-            return {
-                "tool": "dummy",
-                "action": "poi",
-                "params": {"query": m.group(1).strip(), "near": m.group(2).strip()}
-            }
-
-        # ROUTE: from X to Y
-        m = re.match(r"give me a route from (.+) to (.+)", lower)
-        if m:
-            return {
-                "tool": "osm",
-                "action": "route",
-                "params": {"origin": m.group(1).strip(), "destination": m.group(2).strip()}
-            }
+        for pat, handler in _RULES:
+            m = pat.match(key)
+            if m:
+                return self._cache_plan(key, handler(m))
 
         # TRAVEL MATRIX — extract list of places
-        if "matrix" in lower:
-            m = re.search(r"matrix (for )?(.*)", lower)
+        if "matrix" in key:
+            m = _RE_MATRIX.search(key)
             if m:
                 places_raw = m.group(2)
                 places = [p.strip() for p in places_raw.split(",") if p.strip()]
                 if places:
                     print(f"DEBUG — matrix extracted places: {places}")
-                    return {"tool": "osm", "action": "matrix", "params": {"places": places}}
+                    return self._cache_plan(key, {"tool": "osm", "action": "matrix", "params": {"places": places}})
             return {"error": "Could not extract places for matrix."}
 
         # REPEAT LAST
-        if lower in {"again", "repeat", "same"} and self.last_plan:
+        if key in {"again", "repeat", "same"} and self.last_plan:
             return self.last_plan
 
         # ==============================
@@ -188,8 +286,7 @@ class AssistantAgent:
 
         plan = self._extract_json(llm_out)
         if plan and "tool" in plan:
-            self.last_plan = plan
-            return plan
+            return self._cache_plan(key, plan)
 
         return {"error": "Failed to interpret", "raw": llm_out}
 
@@ -3,10 +3,13 @@
 # Improved POI matching with plural & synonyms support
 # ==========================
 from __future__ import annotations
-import math
 from dataclasses import dataclass
 from typing import Dict, Any, List, Tuple, Optional
 
+import numpy as np
+
+from _geo_kernels import haversine_km, haversine_batch, warmup
+
 @dataclass(frozen=True)
 class DummyServerParams:
     name: str = "dummy"
@@ -33,6 +36,30 @@ class DummyMapServer:
             "park": ["park", "parks"],
         }
 
+        # Structure-of-arrays coordinate columns so distance filters run as
+        # one batched haversine instead of a per-place Python loop.
+        self._lat = np.array([p["lat"] for p in self.places])
+        self._lon = np.array([p["lon"] for p in self.places])
+
+        # Query-independent per-place text is lowered once here instead of
+        # on every search, and the synonym table is inverted into a
+        # singular-form -> category index so a query resolves its target
+        # category with one dict lookup before the place loop.
+        self._name_lower = [p["name"].lower() for p in self.places]
+        self._cat_lower = [p["category"].lower() for p in self.places]
+        self._syn_to_cat: Dict[str, str] = {}
+        for cat, syns in self.category_synonyms.items():
+            for s in syns:
+                self._syn_to_cat[s.rstrip("s")] = cat
+
+        # Memoized string lookups for _resolve: REPL sessions tend to reuse
+        # the same 'near' anchor, so don't re-scan the place table each time.
+        self._resolve_cache: Dict[str, Optional[Dict[str, float]]] = {}
+
+        # Compile the shared kernels now so the first user query doesn't
+        # pay the JIT cost (no-op without Numba).
+        warmup()
+
     # -------------------------------
     # GEOCODE
     # -------------------------------
@@ -42,8 +69,8 @@ class DummyMapServer:
         q = query.lower()
         return [
             {"name": p["name"], "lat": p["lat"], "lon": p["lon"]}
-            for p in self.places
-            if q in p["name"].lower()
+            for p, name in zip(self.places, self._name_lower)
+            if q in name
         ]
 
     # -------------------------------
@@ -51,8 +78,12 @@ class DummyMapServer:
     # -------------------------------
     def _resolve(self, loc: Any) -> Optional[Dict[str, float]]:
         if isinstance(loc, str):
+            if loc in self._resolve_cache:
+                return self._resolve_cache[loc]
             res = self.geocode(loc)
-            return res[0] if res else None
+            val = res[0] if res else None
+            self._resolve_cache[loc] = val
+            return val
         if isinstance(loc, (tuple, list)) and len(loc) == 2:
             return {"lat": float(loc[0]), "lon": float(loc[1])}
         if isinstance(loc, dict) and "lat" in loc and "lon" in loc:
@@ -69,18 +100,18 @@ class DummyMapServer:
         if not orig or not dest:
             return {"error": "Origin or destination not found."}
 
-        R = 6371.0
-        phi1, phi2 = math.radians(orig["lat"]), math.radians(dest["lat"])
-        dphi = math.radians(dest["lat"] - orig["lat"])
-        dlmb = math.radians(dest["lon"] - orig["lon"])
-
-        a = math.sin(dphi / 2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        dist = R * c
-
+        dist = haversine_km(orig["lat"], orig["lon"], dest["lat"], dest["lon"])
         minutes = (dist / 50.0) * 60.0
         return {"distance_km": round(dist, 3), "duration_min": round(minutes, 1)}
 
+    # -------------------------------
+    # VECTORIZED HAVERSINE
+    # -------------------------------
+    def _haversine_vec(self, lat0: float, lon0: float) -> np.ndarray:
+        """Distances (km) from (lat0, lon0) to every place, in one batch call."""
+        out = np.empty(self._lat.size)
+        return haversine_batch(lat0, lon0, self._lat, self._lon, out)
+
     # -------------------------------
     # POI SEARCH (IMPROVED)
     # -------------------------------
@@ -92,45 +123,38 @@ class DummyMapServer:
         q_base = q.rstrip("s")  # plural handling
         center = self._resolve(near) if near else None
 
-        results: List[Dict[str, Any]] = []
-
-        for p in self.places:
-            name = p["name"].lower()
-            category = p["category"].lower()
-
-            # Name match
-            name_match = q in name
+        # Resolve the query's category once, then the per-place check is a
+        # substring test plus a string equality
+        target_cat = self._syn_to_cat.get(q_base)
+        match = np.zeros(len(self.places), dtype=bool)
+        name_hit = np.zeros(len(self.places), dtype=bool)
+        for i in range(len(self.places)):
+            name_hit[i] = q in self._name_lower[i]
+            category_match = target_cat is not None and target_cat == self._cat_lower[i]
+            match[i] = name_hit[i] or category_match
 
-            # Category match using synonyms & plural handling
-            category_list = self.category_synonyms.get(category, [])
-            category_match = any(q_base == c.rstrip("s") for c in category_list)
-
-            if not (name_match or category_match):
-                continue
-
-            # If searching near a place → filter by distance
-            if center:
-                R = 6371.0
-                dphi = math.radians(p["lat"] - center["lat"])
-                dlmb = math.radians(p["lon"] - center["lon"])
-
-                phi1, phi2 = math.radians(center["lat"]), math.radians(p["lat"])
-                a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlmb/2)**2
-                c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-                dist = R * c
-
-                if dist > 5.0:  # 5km radius
-                    continue
+        results: List[Dict[str, Any]] = []
 
+        if center:
+            # One vectorized haversine over the whole table, then mask.
+            # Name hits stay in regardless of radius — the user asked for
+            # that place by name; only category hits are distance-filtered.
+            dists = self._haversine_vec(center["lat"], center["lon"])
+            keep = name_hit | (match & (dists <= 5.0))  # 5km radius
+            for i in np.flatnonzero(keep):
+                p = self.places[i]
                 results.append({
                     "name": p["name"],
                     "category": p["category"],
                     "lat": p["lat"],
                     "lon": p["lon"],
-                    "distance_km": round(dist, 3)
+                    "distance_km": round(float(dists[i]), 3)
                 })
-            else:
-                # No "near" filter
+            results.sort(key=lambda r: r.get("distance_km", 0.0))
+        else:
+            # No "near" filter
+            for i in np.flatnonzero(match):
+                p = self.places[i]
                 results.append({
                     "name": p["name"],
                     "category": p["category"],
@@ -138,7 +162,4 @@ class DummyMapServer:
                     "lon": p["lon"]
                 })
 
-        if center:
-            results.sort(key=lambda r: r.get("distance_km", 0.0))
-
         return results
@@ -1,23 +1,66 @@
 # ==========================
 # File: ollama_client.py
 # ==========================
+import json
+
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+
+    def _dumps(obj):
+        return orjson.dumps(obj)
+
+    def _loads(data):
+        return orjson.loads(data)
+except ImportError:  # fall back to the stdlib codec
+    def _dumps(obj):
+        return json.dumps(obj).encode("utf-8")
+
+    def _loads(data):
+        return json.loads(data)
 
 class OllamaClient:
+    # (connect, read) — generation can take a while, connecting should not
+    TIMEOUT = (3.05, 120)
+
     def __init__(self, model="llama3"):
         self.model = model
         self.url = "http://localhost:11434/api/chat"
+        # Persistent session so every chat turn reuses the same TCP
+        # connection instead of reconnecting, mirroring OpenStreetMapServer.
+        self.session = requests.Session()
+        self.session.headers["Content-Type"] = "application/json"
+        self.session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
 
-    def chat(self, messages):
+    def close(self):
+        """Release the pooled connection to the Ollama daemon."""
+        self.session.close()
+
+    def chat_stream(self, messages):
+        """Yield content deltas as the model generates them."""
         payload = {
             "model": self.model,
             "messages": messages,
-            "stream": False
+            "stream": True
         }
 
-        response = requests.post(self.url, json=payload)
-        response.raise_for_status()
-        data = response.json()
+        with self.session.post(self.url, data=_dumps(payload), stream=True, timeout=self.TIMEOUT) as response:
+            response.raise_for_status()
+            # Each line is a JSON object:
+            # {"message": {"role": "...", "content": "..."}, "done": bool}
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                obj = _loads(line)
+                content = obj.get("message", {}).get("content", "")
+                if content:
+                    yield content
+                if obj.get("done"):
+                    break
 
-        # Ollama returns: {"message": {"role": "...", "content": "..."}}
-        return data["message"]["content"]
+    def chat(self, messages):
+        # Streaming avoids server-side buffering of the whole response;
+        # assembling the deltas keeps the return type unchanged.
+        return "".join(self.chat_stream(messages))
@@ -2,12 +2,84 @@
 # File: openstreetmap_server.py
 # =============================
 from __future__ import annotations
+import asyncio
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dataclasses import dataclass
+from types import MappingProxyType
 from typing import Any, Dict, List, Tuple, Optional
+import os
 import requests, urllib.parse
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+try:
+    import diskcache
+except ImportError:  # persistent geocode cache becomes a no-op
+    diskcache = None
+
+try:
+    import orjson
+except ImportError:  # fall back to resp.json() / stdlib parsing
+    orjson = None
+
+try:
+    import aiohttp
+except ImportError:  # amatrix() reports the missing dependency
+    aiohttp = None
+
+
+# Constant request params, built once and shared immutably; calls merge in
+# only the fields that vary. Endpoint URLs stay on the frozen params
+# dataclass so deployments can point at self-hosted instances.
+_GEOCODE_PARAMS = MappingProxyType({"format": "json", "limit": 3})
+_REVERSE_PARAMS = MappingProxyType({"format": "json"})
+_ROUTE_PARAMS = MappingProxyType({"overview": "false"})
+_TABLE_PARAMS = MappingProxyType({"annotations": "duration,distance"})
+
+# Preference order for Overpass batch geocoding: a city named X beats a
+# same-named town, village, etc.; untagged values rank last.
+_PLACE_RANK = MappingProxyType({
+    "city": 0,
+    "town": 1,
+    "village": 2,
+    "hamlet": 3,
+    "suburb": 4,
+    "locality": 5,
+})
+
+
+class _TTLCache:
+    """Small thread-safe LRU with a per-entry time-to-live."""
+
+    def __init__(self, max_size: int = 4096, ttl_s: float = 86400.0):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self._data: OrderedDict[Any, Tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            ts, value = item
+            if time.time() - ts >= self.ttl_s:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.time(), value)
+            if len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
 
 @dataclass(frozen=True)
 class OpenStreetMapServerParams:
@@ -25,6 +97,20 @@ class OpenStreetMapServerParams:
     timeout_s: int = 12
     retry_total: int = 3
     retry_backoff: float = 0.5
+    cache_max_size: int = 512
+    cache_ttl_s: float = 600.0
+    disk_cache_dir: Optional[str] = "~/.cache/osm_sdk"
+    disk_cache_size: int = 256 * 1024 * 1024
+    disk_cache_ttl_s: float = 7 * 86400.0
+    # Minimum spacing between Nominatim requests. The default honours the
+    # public instance's ~1 req/s usage policy; set to 0 for a self-hosted
+    # Nominatim where parallel geocoding can run unthrottled.
+    nominatim_min_interval_s: float = 1.0
+    geocode_workers: int = 8
+    geo_mem_cache_size: int = 4096
+    geo_mem_cache_ttl_s: float = 86400.0
+    pool_connections: int = 16
+    pool_maxsize: int = 16
 
 
 class OpenStreetMapServer:
@@ -40,8 +126,13 @@ class OpenStreetMapServer:
     def __init__(self, params: Optional[OpenStreetMapServerParams] = None):
         self.p = params or OpenStreetMapServerParams()
         self.headers = {"User-Agent": self.p.user_agent}
-        # Robust session with retries and backoff
+        # Robust session with retries and backoff; headers are set once on
+        # the session instead of being merged into every request
         self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        # Explicitly ask for compressed bodies — OSRM table responses reach
+        # tens of KB for modest N; requests decompresses transparently.
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
         retry = Retry(
             total=self.p.retry_total,
             read=self.p.retry_total,
@@ -50,25 +141,127 @@ class OpenStreetMapServer:
             status_forcelist=(429, 500, 502, 503, 504),
             allowed_methods=("GET", "POST"),
             raise_on_status=False,
+            respect_retry_after_header=True,
+        )
+        # Pool sized for the concurrent geocode fan-out so parallel requests
+        # reuse kept-alive connections instead of opening new ones.
+        adapter = HTTPAdapter(
+            max_retries=retry,
+            pool_connections=self.p.pool_connections,
+            pool_maxsize=self.p.pool_maxsize,
         )
-        adapter = HTTPAdapter(max_retries=retry)
         self.session.mount("http://", adapter)
         self.session.mount("https://", adapter)
+        # In-process LRU+TTL cache for raw responses: key -> (timestamp, payload).
+        # Repeat geocode/route/matrix queries skip the HTTP round-trip entirely.
+        self._cache: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_stats = {"hits": 0, "misses": 0}
+        self._throttle_lock = threading.Lock()
+        self._next_request_ts = 0.0
+        # Result-level cache on normalized geocode keys, so 'Paris ' and
+        # 'paris' collapse to one entry regardless of request shape.
+        self._geo_mem = _TTLCache(self.p.geo_mem_cache_size, self.p.geo_mem_cache_ttl_s)
+        # (connect, read): fail fast on unreachable hosts, allow slow bodies
+        self._timeout = (3.05, self.p.timeout_s)
+        # Persistent (sqlite-backed) geocode cache so warm keys survive
+        # process restarts. Disabled when diskcache is missing or
+        # disk_cache_dir is None (e.g. in tests).
+        self.geo_cache = None
+        if diskcache is not None and self.p.disk_cache_dir:
+            self.geo_cache = diskcache.Cache(
+                os.path.expanduser(self.p.disk_cache_dir),
+                size_limit=self.p.disk_cache_size,
+            )
+
+    # -----------------------------
+    # Lifecycle
+    # -----------------------------
+    def close(self) -> None:
+        """Release pooled connections and the on-disk cache."""
+        self.session.close()
+        if self.geo_cache is not None:
+            self.geo_cache.close()
+
+    def __enter__(self) -> "OpenStreetMapServer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
 
     # -----------------------------
     # Helpers
     # -----------------------------
+    @staticmethod
+    def _cache_key(url: str, params: Optional[Dict[str, Any]], data: Optional[str]) -> str:
+        qs = urllib.parse.urlencode(sorted(params.items())) if params else ""
+        raw = f"{url}?{qs}{data or ''}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _throttle_nominatim(self) -> None:
+        """Space out Nominatim requests when a minimum interval is configured."""
+        if self.p.nominatim_min_interval_s <= 0:
+            return
+        with self._throttle_lock:
+            wait = self._next_request_ts - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            self._next_request_ts = time.time() + self.p.nominatim_min_interval_s
+
     def _request_json(self, url: str, *, params: Optional[Dict[str, Any]] = None, data: Optional[str] = None) -> Dict[str, Any] | List[Any]:
+        key = self._cache_key(url, params, data)
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None and time.time() - cached[0] < self.p.cache_ttl_s:
+                self._cache.move_to_end(key)
+                self.cache_stats["hits"] += 1
+                return cached[1]
+            self.cache_stats["misses"] += 1
         try:
             if data is not None:
-                resp = self.session.post(url, params=params, data=data, headers=self.headers, timeout=self.p.timeout_s)
+                resp = self.session.post(url, params=params, data=data, timeout=self._timeout)
             else:
-                resp = self.session.get(url, params=params, headers=self.headers, timeout=self.p.timeout_s)
+                resp = self.session.get(url, params=params, timeout=self._timeout)
             resp.raise_for_status()
-            return resp.json()
+            # orjson parses large OSRM matrices several times faster than
+            # the stdlib decoder behind resp.json()
+            result = orjson.loads(resp.content) if orjson is not None else resp.json()
+            if not (isinstance(result, dict) and result.get("error")):
+                with self._cache_lock:
+                    self._cache[key] = (time.time(), result)
+                    if len(self._cache) > self.p.cache_max_size:
+                        self._cache.popitem(last=False)
+            return result
         except Exception as e:
             return {"error": str(e), "url": url}
 
+    @staticmethod
+    def _parse_geocode_results(data: Any) -> List[Dict[str, Any]]:
+        results: List[Dict[str, Any]] = []
+        for i in data:
+            if "lat" in i and "lon" in i:
+                try:
+                    results.append({
+                        "display_name": i.get("display_name", ""),
+                        "lat": float(i["lat"]),
+                        "lon": float(i["lon"])
+                    })
+                except Exception:
+                    continue
+        return results
+
+    def _cached_resolve(self, address: str) -> Optional[Dict[str, float]]:
+        """Resolve a place name from the geocode caches only — no network."""
+        norm = address.strip().lower()
+        hit = self._geo_mem.get(("geo", norm))
+        if hit is None and self.geo_cache is not None:
+            hit = self.geo_cache.get(f"geo:{norm}")
+            if hit is not None:
+                self._geo_mem.put(("geo", norm), hit)
+        if hit and "error" not in hit[0]:
+            return {"lat": hit[0]["lat"], "lon": hit[0]["lon"]}
+        return None
+
     def _resolve(self, loc: Any) -> Optional[Dict[str, float]]:
         if isinstance(loc, str):
             res = self.geocode(loc)
@@ -85,51 +278,78 @@ class OpenStreetMapServer:
     def geocode(self, address: str) -> List[Dict[str, Any]]:
         if not address:
             return []
-        params = {"q": address, "format": "json", "limit": 3}
+        norm = address.strip().lower()
+        mem_key = ("geo", norm)
+        hit = self._geo_mem.get(mem_key)
+        if hit is not None:
+            return hit
+        cache_key = f"geo:{norm}"
+        if self.geo_cache is not None:
+            hit = self.geo_cache.get(cache_key)
+            if hit is not None:
+                self._geo_mem.put(mem_key, hit)
+                return hit
+        params = {**_GEOCODE_PARAMS, "q": address}
         url = self.p.nominatim_search_url
+        self._throttle_nominatim()
         data = self._request_json(url, params=params)
         if isinstance(data, dict) and data.get("error"):
             return [{"error": data["error"]}]
-        results: List[Dict[str, Any]] = []
-        for i in data:  # type: ignore[assignment]
-            if "lat" in i and "lon" in i:
-                try:
-                    results.append({
-                        "display_name": i.get("display_name", ""),
-                        "lat": float(i["lat"]),
-                        "lon": float(i["lon"])
-                    })
-                except Exception:
-                    continue
+        results = self._parse_geocode_results(data)
+        if results:
+            self._geo_mem.put(mem_key, results)
+            if self.geo_cache is not None:
+                self.geo_cache.set(cache_key, results, expire=self.p.disk_cache_ttl_s)
         return results
 
     # ---------------------------------
     # 2) Reverse Geocoding (new)
     # ---------------------------------
     def reverse_geocode(self, lat: float, lon: float) -> Dict[str, Any]:
-        params = {"format": "json", "lat": lat, "lon": lon}
+        # Rounding to ~1 m collapses GPS jitter onto the same cache slot.
+        mem_key = ("rev", round(lat, 5), round(lon, 5))
+        hit = self._geo_mem.get(mem_key)
+        if hit is not None:
+            return hit
+        cache_key = f"rev:{round(lat, 5)}:{round(lon, 5)}"
+        if self.geo_cache is not None:
+            hit = self.geo_cache.get(cache_key)
+            if hit is not None:
+                self._geo_mem.put(mem_key, hit)
+                return hit
+        params = {**_REVERSE_PARAMS, "lat": lat, "lon": lon}
         url = self.p.nominatim_reverse_url
+        self._throttle_nominatim()
         data = self._request_json(url, params=params)
         if isinstance(data, dict) and data.get("error"):
             return data
-        return {
+        result = {
             "display_name": data.get("display_name", "unknown"),  # type: ignore[union-attr]
             "lat": float(lat),
             "lon": float(lon),
         }
+        self._geo_mem.put(mem_key, result)
+        if self.geo_cache is not None:
+            self.geo_cache.set(cache_key, result, expire=self.p.disk_cache_ttl_s)
+        return result
 
     # -----------------------------
     # 3) Routing using OSRM API
     # -----------------------------
     def route(self, origin: Any, destination: Any) -> Dict[str, Any]:
-        orig = self._resolve(origin)
-        dest = self._resolve(destination)
+        if isinstance(origin, str) or isinstance(destination, str):
+            # The two geocodes are independent network calls; overlap them
+            # so route setup costs one round-trip instead of two.
+            with ThreadPoolExecutor(max_workers=2) as ex:
+                orig, dest = ex.map(self._resolve, (origin, destination))
+        else:
+            orig = self._resolve(origin)
+            dest = self._resolve(destination)
         if not orig or not dest:
             return {"error": "Could not resolve origin or destination."}
 
         url = f"{self.p.osrm_route_url}/{orig['lon']},{orig['lat']};{dest['lon']},{dest['lat']}"
-        params = {"overview": "false"}
-        data = self._request_json(url, params=params)
+        data = self._request_json(url, params=_ROUTE_PARAMS)
         if isinstance(data, dict) and data.get("error"):
             return data
         if not data.get("routes"):
@@ -143,19 +363,100 @@ class OpenStreetMapServer:
     # -------------------------------------------
     # 4) Distance/Time Matrix via OSRM Table (new)
     # -------------------------------------------
+    def _overpass_batch_geocode(self, names: List[str]) -> Dict[str, Tuple[float, float]]:
+        """Resolve many place names to coordinates in one Overpass round-trip.
+
+        Matching is restricted to place-tagged nodes via a case-insensitive
+        exact-name regex, and candidates are ranked by place importance so
+        the city named 'Paris' beats a same-named hamlet or bus stop. Names
+        without a match are simply absent so callers can fall back to
+        per-name geocoding.
+        """
+        def ql_pattern(name: str) -> str:
+            # Strip QL string metacharacters, escape regex ones, then double
+            # the backslashes so they survive QL's own string unescaping —
+            # QL quoted strings only accept \n \t \" \' \\ \u, so a bare
+            # re.escape sequence like 'New\ York' is a parse error.
+            escaped = re.escape(name.replace("\\", "").replace('"', "").strip())
+            return escaped.replace("\\", "\\\\")
+
+        clauses = "".join(f'node["name"~"^{ql_pattern(n)}$",i]["place"];' for n in names)
+        # Bound both server time and response size; a small multiple of the
+        # batch leaves room for same-named places to rank between.
+        query = (
+            f"[out:json][timeout:{int(self.p.timeout_s)}];"
+            f"({clauses});out center {20 * len(names)};"
+        )
+        data = self.overpass(query)
+        wanted = {n.strip().lower(): n for n in names}
+        best: Dict[str, Tuple[int, float, float]] = {}
+        for el in data.get("elements", []):
+            tags = el.get("tags", {})
+            orig = wanted.get(tags.get("name", "").strip().lower())
+            if orig is None:
+                continue
+            lat = el.get("lat", el.get("center", {}).get("lat"))
+            lon = el.get("lon", el.get("center", {}).get("lon"))
+            if lat is None or lon is None:
+                continue
+            rank = _PLACE_RANK.get(tags.get("place"), len(_PLACE_RANK))
+            cur = best.get(orig)
+            if cur is None or rank < cur[0]:
+                best[orig] = (rank, float(lat), float(lon))
+        return {name: (lat, lon) for name, (_, lat, lon) in best.items()}
+
     def matrix(self, places: List[Any]) -> Dict[str, Any]:
         """Return travel time (s) and distance (m) matrix for given places.
         Accepts strings (geocode), (lat, lon) tuples, or {lat, lon} dicts.
         """
-        coords: List[Dict[str, float]] = []
-        for p in places:
-            r = self._resolve(p)
+        coords: List[Optional[Dict[str, float]]] = [None] * len(places)
+        to_geo = []
+        for i, p in enumerate(places):
+            if not isinstance(p, str):
+                coords[i] = self._resolve(p)
+                continue
+            # Warm names resolve from the geocode caches for free; only
+            # genuine misses go to the network below.
+            coords[i] = self._cached_resolve(p)
+            if coords[i] is None:
+                to_geo.append((i, p))
+        if len(to_geo) >= 3:
+            # Enough misses are worth one fused Overpass query: a single
+            # round-trip instead of one Nominatim call per place. Names it
+            # can't match fall back to the per-place path below.
+            batch = self._overpass_batch_geocode([p for _, p in to_geo])
+            remaining = []
+            for i, p in to_geo:
+                hit = batch.get(p)
+                if hit:
+                    coords[i] = {"lat": hit[0], "lon": hit[1]}
+                    # Store in geocode()'s result format so later geocode/
+                    # route calls for the same name skip the network too.
+                    results = [{"display_name": p, "lat": hit[0], "lon": hit[1]}]
+                    norm = p.strip().lower()
+                    self._geo_mem.put(("geo", norm), results)
+                    if self.geo_cache is not None:
+                        self.geo_cache.set(
+                            f"geo:{norm}", results, expire=self.p.disk_cache_ttl_s
+                        )
+                else:
+                    remaining.append((i, p))
+            to_geo = remaining
+        if to_geo:
+            # Geocodes are independent network calls; fan them out so matrix
+            # setup costs ~one round-trip instead of one per place.
+            with ThreadPoolExecutor(max_workers=min(self.p.geocode_workers, len(to_geo))) as ex:
+                resolved = ex.map(self._resolve, [p for _, p in to_geo])
+                for (i, _), r in zip(to_geo, resolved):
+                    coords[i] = r
+        for p, r in zip(places, coords):
             if not r:
                 return {"error": f"Could not resolve place: {p!r}"}
-            coords.append(r)
-        coord_str = ";".join(f"{c['lon']},{c['lat']}" for c in coords)
+        # Fixed 6-decimal formatting (~0.1 m) keeps the joined URL length
+        # bounded and the cache key stable across float repr differences.
+        coord_str = ";".join(f"{c['lon']:.6f},{c['lat']:.6f}" for c in coords)
         url = f"{self.p.osrm_table_url}/{coord_str}"
-        data = self._request_json(url)
+        data = self._request_json(url, params=_TABLE_PARAMS)
         if isinstance(data, dict) and data.get("error"):
             return data
         if not data or "durations" not in data:
@@ -165,16 +466,102 @@ class OpenStreetMapServer:
             "distances_m": data.get("distances"),  # may be absent on some OSRM deployments
         }
 
+    async def _ageocode(self, session: "aiohttp.ClientSession", address: str) -> List[Dict[str, Any]]:
+        """Async geocode sharing the normalized result cache with geocode()."""
+        norm = address.strip().lower()
+        mem_key = ("geo", norm)
+        hit = self._geo_mem.get(mem_key)
+        if hit is not None:
+            return hit
+        cache_key = f"geo:{norm}"
+        if self.geo_cache is not None:
+            hit = self.geo_cache.get(cache_key)
+            if hit is not None:
+                self._geo_mem.put(mem_key, hit)
+                return hit
+        params = {**_GEOCODE_PARAMS, "q": address}
+        # Same lock and timestamp as the sync path, run off the event loop
+        # because it may sleep: concurrent async geocodes still honour the
+        # public instance's request spacing.
+        await asyncio.to_thread(self._throttle_nominatim)
+        try:
+            async with session.get(self.p.nominatim_search_url, params=params) as resp:
+                resp.raise_for_status()
+                data = await resp.json(content_type=None)
+        except Exception as e:
+            return [{"error": str(e)}]
+        results = self._parse_geocode_results(data)
+        if results:
+            self._geo_mem.put(mem_key, results)
+            if self.geo_cache is not None:
+                self.geo_cache.set(cache_key, results, expire=self.p.disk_cache_ttl_s)
+        return results
+
+    async def _aresolve(self, session: "aiohttp.ClientSession", loc: Any) -> Optional[Dict[str, float]]:
+        if isinstance(loc, str):
+            res = await self._ageocode(session, loc)
+            if res and "error" not in res[0]:
+                return {"lat": res[0]["lat"], "lon": res[0]["lon"]}
+            return None
+        return self._resolve(loc)
+
+    async def amatrix(self, places: List[Any]) -> Dict[str, Any]:
+        """Async variant of matrix(): one event loop drives all geocodes
+        concurrently, which scales to hundreds of places without a thread
+        per request. The sync matrix() remains the default path.
+        """
+        if aiohttp is None:
+            return {"error": "amatrix requires the aiohttp package"}
+        timeout = aiohttp.ClientTimeout(total=self.p.timeout_s)
+        connector = aiohttp.TCPConnector(limit_per_host=8, keepalive_timeout=75)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=self.headers) as session:
+            coords = await asyncio.gather(*[self._aresolve(session, p) for p in places])
+            for p, c in zip(places, coords):
+                if not c:
+                    return {"error": f"Could not resolve place: {p!r}"}
+            coord_str = ";".join(f"{c['lon']:.6f},{c['lat']:.6f}" for c in coords)
+            url = f"{self.p.osrm_table_url}/{coord_str}"
+            try:
+                async with session.get(url, params=dict(_TABLE_PARAMS)) as resp:
+                    resp.raise_for_status()
+                    data = await resp.json(content_type=None)
+            except Exception as e:
+                return {"error": str(e), "url": url}
+        if not data or "durations" not in data:
+            return {"error": "No matrix returned."}
+        return {
+            "durations_s": data["durations"],
+            "distances_m": data.get("distances"),
+        }
+
     # -------------------------------------------
     # 5) Optional: Overpass wrapper with endpoint fallback
     # -------------------------------------------
     def overpass(self, query: str) -> Dict[str, Any]:
+        """Race all configured endpoints and return the first success.
+
+        Sequential fallback meant a dead first endpoint cost a full timeout
+        before the next was even tried; racing bounds the worst case to a
+        single timeout.
+        """
+        endpoints = self.p.overpass_endpoints
         last_err: Optional[str] = None
-        for ep in self.p.overpass_endpoints:
-            resp = self._request_json(ep, params=None, data=query)
-            if isinstance(resp, dict) and resp.get("error"):
-                last_err = resp["error"]
-                continue
-            return {"elements": resp.get("elements", [])}  # type: ignore[union-attr]
-        return {"error": last_err or "All Overpass endpoints failed"}
+        ex = ThreadPoolExecutor(max_workers=len(endpoints))
+        try:
+            pending = {
+                ex.submit(self._request_json, ep, params=None, data=query)
+                for ep in endpoints
+            }
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    resp = f.result()
+                    if isinstance(resp, dict) and resp.get("error"):
+                        last_err = resp["error"]
+                        continue
+                    return {"elements": resp.get("elements", [])}  # type: ignore[union-attr]
+            return {"error": last_err or "All Overpass endpoints failed"}
+        finally:
+            # Don't wait out the losers; in-flight requests are abandoned.
+            ex.shutdown(wait=False, cancel_futures=True)
 
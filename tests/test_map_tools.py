@@ -1,27 +1,39 @@
 # ==========================
 # File: tests/test_map_tools.py
 # ==========================
+import json
 import requests
 import unittest
 from unittest.mock import patch, MagicMock
-from openstreetmap_server import OpenStreetMapServer
+from openstreetmap_server import OpenStreetMapServer, OpenStreetMapServerParams
+
+
+def _mock_response(payload):
+    """Mock response carrying the payload both as raw bytes (orjson path)
+    and via .json() (stdlib fallback)."""
+    resp = MagicMock()
+    resp.raise_for_status.return_value = None
+    resp.content = json.dumps(payload).encode("utf-8")
+    resp.json.return_value = payload
+    return resp
 
 
 class TestOpenStreetMapServer(unittest.TestCase):
     def setUp(self):
-        self.s = OpenStreetMapServer()
+        # Disable the persistent disk cache so tests stay hermetic, and the
+        # public-Nominatim throttle so mocked requests don't sleep.
+        self.s = OpenStreetMapServer(
+            OpenStreetMapServerParams(disk_cache_dir=None, nominatim_min_interval_s=0.0)
+        )
 
     # -------------------------------------------------
     # Test geocode
     # -------------------------------------------------
     @patch("requests.Session.get")
     def test_geocode_ok(self, mock_get):
-        mock_resp = MagicMock()
-        mock_resp.raise_for_status.return_value = None
-        mock_resp.json.return_value = [
-            {"display_name": "Paris, France", "lat": "48.8566", "lon": "2.3522"}
-        ]
-        mock_get.return_value = mock_resp
+        mock_get.return_value = _mock_response(
+            [{"display_name": "Paris, France", "lat": "48.8566", "lon": "2.3522"}]
+        )
 
         res = self.s.geocode("Paris")
         self.assertEqual(res[0]["display_name"], "Paris, France")
@@ -32,10 +44,7 @@ class TestOpenStreetMapServer(unittest.TestCase):
     # -------------------------------------------------
     @patch("requests.Session.get")
     def test_reverse_geocode_ok(self, mock_get):
-        mock_resp = MagicMock()
-        mock_resp.raise_for_status.return_value = None
-        mock_resp.json.return_value = {"display_name": "Somewhere"}
-        mock_get.return_value = mock_resp
+        mock_get.return_value = _mock_response({"display_name": "Somewhere"})
 
         res = self.s.reverse_geocode(48.8566, 2.3522)
         self.assertEqual(res["display_name"], "Somewhere")
@@ -45,17 +54,23 @@ class TestOpenStreetMapServer(unittest.TestCase):
     # -------------------------------------------------
     @patch("requests.Session.get")
     def test_route_ok(self, mock_get):
-        mock_resp = MagicMock()
-        mock_resp.raise_for_status.return_value = None
-        mock_resp.json.side_effect = [
-            # geocode origin
-            [{"display_name": "Paris", "lat": "48.8566", "lon": "2.3522"}],
-            # geocode destination
-            [{"display_name": "Berlin", "lat": "52.52", "lon": "13.405"}],
+        # Origin/destination geocodes run concurrently, so answer by query
+        # instead of relying on call order.
+        def fake_get(url, params=None, **kwargs):
+            if "nominatim" in url and params["q"] == "Paris":
+                return _mock_response(
+                    [{"display_name": "Paris", "lat": "48.8566", "lon": "2.3522"}]
+                )
+            if "nominatim" in url:
+                return _mock_response(
+                    [{"display_name": "Berlin", "lat": "52.52", "lon": "13.405"}]
+                )
             # osrm route
-            {"routes": [{"distance": 1050000.0, "duration": 36000.0}]},
-        ]
-        mock_get.return_value = mock_resp
+            return _mock_response(
+                {"routes": [{"distance": 1050000.0, "duration": 36000.0}]}
+            )
+
+        mock_get.side_effect = fake_get
 
         res = self.s.route("Paris", "Berlin")
         self.assertIn("distance_km", res)
@@ -66,21 +81,60 @@ class TestOpenStreetMapServer(unittest.TestCase):
     # -------------------------------------------------
     @patch("requests.Session.get")
     def test_matrix_ok(self, mock_get):
-        mock_resp = MagicMock()
-        mock_resp.raise_for_status.return_value = None
-        mock_resp.json.side_effect = [
-            # geocode Paris
-            [{"display_name": "Paris", "lat": "48.8566", "lon": "2.3522"}],
-            # geocode Berlin
-            [{"display_name": "Berlin", "lat": "52.52", "lon": "13.405"}],
+        # Geocodes run concurrently, so answer by URL/query instead of
+        # relying on call order.
+        table_urls = []
+
+        def fake_get(url, params=None, **kwargs):
+            if "nominatim" in url and params["q"] == "Paris":
+                return _mock_response(
+                    [{"display_name": "Paris", "lat": "48.8566", "lon": "2.3522"}]
+                )
+            if "nominatim" in url:
+                return _mock_response(
+                    [{"display_name": "Berlin", "lat": "52.52", "lon": "13.405"}]
+                )
             # osrm table
-            {"durations": [[0, 1], [1, 0]], "distances": [[0, 10], [10, 0]]},
-        ]
-        mock_get.return_value = mock_resp
+            table_urls.append(url)
+            return _mock_response({
+                "durations": [[0, 1], [1, 0]],
+                "distances": [[0, 10], [10, 0]],
+            })
+
+        mock_get.side_effect = fake_get
 
         res = self.s.matrix(["Paris", "Berlin"])
         self.assertIn("durations_s", res)
         self.assertEqual(res["durations_s"][0][1], 1)
+        # One table call with all coordinates joined into a single URL
+        self.assertEqual(len(table_urls), 1)
+        self.assertTrue(table_urls[0].endswith("2.352200,48.856600;13.405000,52.520000"))
+
+    # -------------------------------------------------
+    # Test Overpass batch geocode query generation
+    # -------------------------------------------------
+    @patch.object(OpenStreetMapServer, "overpass")
+    def test_overpass_batch_ql_escaping(self, mock_overpass):
+        queries = []
+
+        def fake_overpass(query):
+            queries.append(query)
+            return {"elements": [
+                {"lat": 40.7128, "lon": -74.006,
+                 "tags": {"name": "New York", "place": "city"}},
+            ]}
+
+        mock_overpass.side_effect = fake_overpass
+
+        res = self.s._overpass_batch_geocode(["New York", "Washington D.C."])
+        self.assertEqual(res["New York"], (40.7128, -74.006))
+        # QL double-quoted strings only accept \n \t \" \' \\ \u escapes, so
+        # every backslash re.escape emits must arrive doubled — otherwise one
+        # multi-word name breaks the whole fused query on every endpoint.
+        self.assertIn('node["name"~"^New\\\\ York$",i]["place"];', queries[0])
+        self.assertIn(
+            'node["name"~"^Washington\\\\ D\\\\.C\\\\.$",i]["place"];', queries[0]
+        )
 
     # -------------------------------------------------
     # Test network error handling
@@ -93,6 +147,9 @@ class TestOpenStreetMapServer(unittest.TestCase):
 
         res = self.s.geocode("Paris")
         self.assertTrue(res and "error" in res[0])
+        # Non-retryable RequestExceptions surface immediately: retries
+        # happen inside the adapter, not by re-issuing session.get
+        mock_get.assert_called_once()
 
 
 if __name__ == "__main__":